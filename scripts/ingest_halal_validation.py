@@ -2,11 +2,16 @@
 
 import argparse
 import csv
+import gzip
+import hashlib
 import json
+import math
 import os
 import re
+from collections import Counter
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from urllib.error import HTTPError
 from urllib.parse import quote
 from urllib.request import Request, urlopen
@@ -22,6 +27,49 @@ REQUIRED_COLUMNS = {
 
 VALIDATION_DIR = Path(__file__).resolve().parent.parent / "data"
 REPORTS_DIR = Path(__file__).resolve().parent.parent / "reports"
+SNAPSHOTS_DIR = REPORTS_DIR / "snapshots"
+EXPORTS_DIR = REPORTS_DIR / "exports"
+
+CC_COLUMN_TYPES = {
+    "cc_halal_status": "text",
+    "cc_halal_likelihood": "text",
+    "cc_halal_type": "text",
+    "cc_halal_confidence": "int",
+    "cc_note": "text",
+    "cc_reasoning_raw": "text",
+    "cc_is_zabiha": "boolean",
+    "cc_certifier_org": "text",
+}
+
+# Snapshots are headerless COPY text rows in this column order.
+SNAPSHOT_COLUMNS = ["id", *CC_COLUMN_TYPES]
+SNAPSHOT_CHUNK_SIZE = 1000
+REST_SNAPSHOT_CHUNK_SIZE = 100
+
+EXPORT_STAGE_TABLE = "halal_ingest_stage"
+# load.sql picks place/places at load time (like detect_table_name) and exposes
+# it through this temp view, since \copy does not interpolate psql variables.
+EXPORT_TARGET_VIEW = "halal_ingest_target"
+EXPORT_CHUNK_SIZE = 50000
+EXPORT_STAGE_COLUMNS = ["seq", "id", "name_file", *CC_COLUMN_TYPES]
+
+JSON_READ_SIZE = 1 << 16
+JSON_ROW_KEYS = ("items", "rows")
+PARQUET_BATCH_SIZE = 10000
+
+# 2**14 one-byte registers: ~16 KB, ~0.8% standard error on distinct ids.
+HLL_PRECISION = 14
+CONFIDENCE_QUANTILES = [0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0]
+INSPECT_INVALID_SAMPLE = 20
+
+COPY_UNESCAPES = {
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "v": "\v",
+}
 
 CERTIFIER_PATTERNS = {
     "SBNY": ["sbny", "shariah board", "shariah board ny"],
@@ -85,18 +133,45 @@ ALCOHOL_KEYWORDS = [
     "liquor",
 ]
 
+SourceRow = Tuple[int, Dict[str, object]]
+
 URL_PATTERN = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Apply halal validation results to Supabase.")
-    parser.add_argument("--file", required=True, help="CSV/XLSX filename in data/ or a path")
+    parser.add_argument(
+        "--file", help="CSV/XLSX/JSON/NDJSON/Parquet filename in data/ or a path"
+    )
     parser.add_argument("--db-url", dest="db_url", help="Postgres connection string")
     parser.add_argument("--use-rest", action="store_true", help="Use Supabase REST API")
     parser.add_argument("--supabase-url", dest="supabase_url", help="Supabase URL")
     parser.add_argument("--supabase-key", dest="supabase_key", help="Supabase service role key")
-    parser.add_argument("--apply", action="store_true", help="Apply updates to the database")
-    return parser.parse_args()
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument("--apply", action="store_true", help="Apply updates to the database")
+    modes.add_argument(
+        "--revert",
+        metavar="RUN",
+        help="Restore the cc_* pre-image captured by an earlier --apply (run id or snapshot "
+        "path); with --use-rest rows are patched one at a time, not in one transaction",
+    )
+    modes.add_argument(
+        "--inspect",
+        action="store_true",
+        help="Stream the file once and print distribution stats without touching the database",
+    )
+    modes.add_argument(
+        "--export",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help="Write an offline COPY + psql load artifact instead of applying "
+        "(default: reports/exports/<run id>)",
+    )
+    args = parser.parse_args()
+    if not args.file and not args.revert:
+        parser.error("--file is required unless --revert is used")
+    return args
 
 
 def resolve_file_path(file_arg: str) -> Path:
@@ -106,28 +181,56 @@ def resolve_file_path(file_arg: str) -> Path:
     return VALIDATION_DIR / file_arg
 
 
+def resolve_snapshot_path(run_arg: str) -> Path:
+    candidate = Path(run_arg)
+    if candidate.is_absolute() or candidate.exists():
+        return candidate
+    return SNAPSHOTS_DIR / f"{run_arg}.tsv.gz"
+
+
+def make_run_id(file_path: Path) -> str:
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return f"{file_path.stem}__{timestamp}"
+
+
+def chunked(items: List[object], size: int) -> List[List[object]]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
 def normalize_header(header: str) -> str:
     return header.strip().lower()
 
 
-def load_csv_rows(file_path: Path) -> List[Dict[str, object]]:
-    rows = []
+def is_blank_row(values: Iterable[object]) -> bool:
+    return not any(str(cell).strip() for cell in values if cell is not None)
+
+
+def normalize_record(record: object, file_path: Path) -> Dict[str, object]:
+    if not isinstance(record, dict):
+        raise ValueError(f"Expected JSON objects in {file_path}, got {type(record).__name__}")
+    return {normalize_header(str(key)): value for key, value in record.items()}
+
+
+def iter_csv_rows(file_path: Path) -> Iterator[SourceRow]:
     with file_path.open("r", encoding="utf-8-sig", newline="") as handle:
         reader = csv.reader(handle)
         try:
             raw_headers = next(reader)
         except StopIteration:
-            return rows
+            return
         headers = [normalize_header(str(h)) for h in raw_headers]
+        last_line = reader.line_num
         for row in reader:
-            if not any(str(cell).strip() for cell in row if cell is not None):
+            # Quoted fields can span lines; report the line the record starts on.
+            line_number, last_line = last_line + 1, reader.line_num
+            if is_blank_row(row):
                 continue
-            row_dict = {headers[i]: row[i] if i < len(row) else None for i in range(len(headers))}
-            rows.append(row_dict)
-    return rows
+            yield line_number, {
+                headers[i]: row[i] if i < len(row) else None for i in range(len(headers))
+            }
 
 
-def load_xlsx_rows(file_path: Path) -> List[Dict[str, object]]:
+def iter_xlsx_rows(file_path: Path) -> Iterator[SourceRow]:
     try:
         import openpyxl
     except ImportError as exc:
@@ -137,26 +240,178 @@ def load_xlsx_rows(file_path: Path) -> List[Dict[str, object]]:
 
     workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
     sheet = workbook.active
-    rows = []
     iterator = sheet.iter_rows(values_only=True)
     try:
         raw_headers = next(iterator)
     except StopIteration:
-        return rows
+        return
     headers = [normalize_header(str(h or "")) for h in raw_headers]
-    for row in iterator:
-        if not any(str(cell).strip() for cell in row if cell is not None):
+    for sheet_row, row in enumerate(iterator, start=2):
+        if is_blank_row(row):
             continue
-        row_dict = {headers[i]: row[i] if i < len(row) else None for i in range(len(headers))}
-        rows.append(row_dict)
-    return rows
+        yield sheet_row, {
+            headers[i]: row[i] if i < len(row) else None for i in range(len(headers))
+        }
+
+
+def iter_ndjson_rows(file_path: Path) -> Iterator[SourceRow]:
+    with file_path.open("r", encoding="utf-8-sig") as handle:
+        for line_number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            row = normalize_record(json.loads(line), file_path)
+            if is_blank_row(row.values()):
+                continue
+            yield line_number, row
+
+
+class JsonStreamReader:
+    """Incremental JSON reader that decodes one value at a time from a text handle."""
+
+    def __init__(self, handle) -> None:
+        self.handle = handle
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.handle.read(JSON_READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON input, found {found or 'end of file'!r}")
+        self.pos += 1
+
+    def decode(self) -> object:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A value ending exactly at the buffer edge may be a truncated number.
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
 
+    def iter_array(self) -> Iterator[object]:
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, found {separator!r}")
+
+
+def iter_json_rows(file_path: Path) -> Iterator[SourceRow]:
+    with file_path.open("r", encoding="utf-8-sig") as handle:
+        reader = JsonStreamReader(handle)
+        first = reader.peek()
+        if first == "[":
+            records = reader.iter_array()
+        elif first == "{":
+            records = iter_json_wrapped_array(reader)
+        else:
+            raise ValueError(f"Expected a JSON array or object in {file_path}")
+        for record_number, record in enumerate(records, start=1):
+            row = normalize_record(record, file_path)
+            if is_blank_row(row.values()):
+                continue
+            yield record_number, row
+
+
+def iter_json_wrapped_array(reader: JsonStreamReader) -> Iterator[object]:
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.decode()
+        reader.expect(":")
+        if key in JSON_ROW_KEYS and reader.peek() == "[":
+            yield from reader.iter_array()
+            return
+        reader.decode()
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or '}}' in JSON object, found {separator!r}")
+
+
+def iter_parquet_rows(file_path: Path) -> Iterator[SourceRow]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError(
+            "pyarrow is required for .parquet files. Install with: pip install pyarrow"
+        ) from exc
 
-def load_rows(file_path: Path) -> List[Dict[str, object]]:
-    if file_path.suffix.lower() == ".csv":
-        return load_csv_rows(file_path)
-    if file_path.suffix.lower() in {".xlsx", ".xlsm"}:
-        return load_xlsx_rows(file_path)
+    parquet_file = pq.ParquetFile(file_path)
+    # Only read the columns the ingest uses; fall back to all columns so the
+    # required-column check can still report what is missing.
+    columns = [
+        name
+        for name in parquet_file.schema_arrow.names
+        if normalize_header(name) in REQUIRED_COLUMNS
+    ]
+    record_number = 0
+    for batch in parquet_file.iter_batches(
+        batch_size=PARQUET_BATCH_SIZE, columns=columns or None
+    ):
+        for record in batch.to_pylist():
+            record_number += 1
+            row = normalize_record(record, file_path)
+            if is_blank_row(row.values()):
+                continue
+            yield record_number, row
+
+
+def iter_rows(file_path: Path) -> Iterator[SourceRow]:
+    """Yield (source position, row) pairs.
+
+    The position is the file line for CSV/NDJSON, the sheet row for XLSX and
+    the 1-based record number for JSON/Parquet.
+    """
+    suffix = file_path.suffix.lower()
+    if suffix == ".csv":
+        return iter_csv_rows(file_path)
+    if suffix in {".xlsx", ".xlsm"}:
+        return iter_xlsx_rows(file_path)
+    if suffix in {".ndjson", ".jsonl"}:
+        return iter_ndjson_rows(file_path)
+    if suffix == ".json":
+        return iter_json_rows(file_path)
+    if suffix == ".parquet":
+        return iter_parquet_rows(file_path)
     raise ValueError(f"Unsupported file type: {file_path.suffix}")
 
 
@@ -214,7 +469,7 @@ def get_supabase_credentials(args: argparse.Namespace) -> Tuple[str, str]:
 
 
 def rest_request(
-    method: str, url: str, headers: Dict[str, str], payload: Optional[Dict[str, object]] = None
+    method: str, url: str, headers: Dict[str, str], payload: Optional[object] = None
 ) -> Tuple[int, str]:
     data = None
     if payload is not None:
@@ -229,6 +484,15 @@ def rest_request(
         return exc.code, body
 
 
+def build_rest_headers(api_key: str) -> Dict[str, str]:
+    return {
+        "apikey": api_key,
+        "Authorization": f"Bearer {api_key}",
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+    }
+
+
 def detect_table_name_rest(base_url: str, headers: Dict[str, str]) -> str:
     for table_name in ("place", "places"):
         status, _ = rest_request(
@@ -260,6 +524,128 @@ def rest_update_row(
     raise RuntimeError(f"REST update failed with status {status}: {body}")
 
 
+def rest_fetch_preimage(
+    base_url: str, headers: Dict[str, str], table_name: str, ids: List[str]
+) -> List[Tuple[object, ...]]:
+    select = ",".join(SNAPSHOT_COLUMNS)
+    rows = []
+    for chunk in chunked(ids, REST_SNAPSHOT_CHUNK_SIZE):
+        id_list = quote(",".join(chunk), safe=",")
+        url = f"{base_url}/rest/v1/{table_name}?select={select}&id=in.({id_list})"
+        status, body = rest_request("GET", url, headers)
+        if status not in (200, 206):
+            raise RuntimeError(f"REST snapshot read failed with status {status}: {body}")
+        for item in json.loads(body) if body else []:
+            rows.append(tuple(item.get(col) for col in SNAPSHOT_COLUMNS))
+    return rows
+
+
+def rest_restore_row(
+    base_url: str,
+    headers: Dict[str, str],
+    table_name: str,
+    row: Dict[str, Optional[str]],
+) -> bool:
+    payload = {col: coerce_snapshot_value(col, row[col]) for col in CC_COLUMN_TYPES}
+    encoded_id = quote(row["id"], safe="")
+    url = f"{base_url}/rest/v1/{table_name}?id=eq.{encoded_id}&select=id"
+    restore_headers = dict(headers)
+    restore_headers["Prefer"] = "return=representation"
+    status, body = rest_request("PATCH", url, restore_headers, payload)
+    if status in (200, 201):
+        return bool(json.loads(body)) if body else False
+    if status == 204:
+        return False
+    raise RuntimeError(f"REST revert failed with status {status}: {body}")
+
+
+def fetch_preimage(cursor, table_name: str, ids: List[str]) -> List[Tuple[object, ...]]:
+    select_sql = f"""
+        select {", ".join(SNAPSHOT_COLUMNS)}
+        from public.{table_name}
+        where id = any(%s::uuid[])
+    """
+    rows = []
+    for chunk in chunked(ids, SNAPSHOT_CHUNK_SIZE):
+        cursor.execute(select_sql, (chunk,))
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def restore_snapshot_chunk(
+    cursor, table_name: str, rows: List[Dict[str, Optional[str]]]
+) -> List[str]:
+    assignments = ",\n".join(
+        f"{col} = v.{col}::{col_type}" for col, col_type in CC_COLUMN_TYPES.items()
+    )
+    arrays = ", ".join(["%s::uuid[]"] + ["%s::text[]"] * len(CC_COLUMN_TYPES))
+    restore_sql = f"""
+        update public.{table_name} as t
+        set
+            {assignments}
+        from unnest({arrays}) as v({", ".join(SNAPSHOT_COLUMNS)})
+        where t.id = v.id
+        returning t.id::text
+    """
+    params = tuple([row[col] for row in rows] for col in SNAPSHOT_COLUMNS)
+    cursor.execute(restore_sql, params)
+    restored_ids = {result[0] for result in cursor.fetchall()}
+    return [row["id"] for row in rows if row["id"] not in restored_ids]
+
+
+def encode_copy_value(value: object) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    text = str(value)
+    return (
+        text.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def decode_copy_value(text: str) -> Optional[str]:
+    if text == "\\N":
+        return None
+    return re.sub(r"\\(.)", lambda m: COPY_UNESCAPES.get(m.group(1), m.group(1)), text)
+
+
+def coerce_snapshot_value(column: str, value: Optional[str]) -> object:
+    if value is None:
+        return None
+    col_type = CC_COLUMN_TYPES.get(column)
+    if col_type == "int":
+        return int(value)
+    if col_type == "boolean":
+        return value == "t"
+    return value
+
+
+def write_snapshot(snapshot_path: Path, rows: List[Tuple[object, ...]]) -> None:
+    snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(snapshot_path, "wt", encoding="utf-8", newline="") as handle:
+        for row in rows:
+            handle.write("\t".join(encode_copy_value(value) for value in row) + "\n")
+
+
+def read_snapshot(snapshot_path: Path) -> List[Dict[str, Optional[str]]]:
+    opener = gzip.open if snapshot_path.suffix.lower() == ".gz" else open
+    rows = []
+    with opener(snapshot_path, "rt", encoding="utf-8", newline="") as handle:
+        for line in handle:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            values = [decode_copy_value(part) for part in line.split("\t")]
+            if len(values) != len(SNAPSHOT_COLUMNS):
+                raise ValueError(f"Malformed snapshot line in {snapshot_path}: {line[:80]}")
+            rows.append(dict(zip(SNAPSHOT_COLUMNS, values)))
+    return rows
+
+
 def parse_int(value: object) -> Optional[int]:
     if value is None:
         return None
@@ -404,6 +790,85 @@ def map_cc_status(halal_likelihood_norm: str, halal_type_norm: str) -> str:
     return "unclear"
 
 
+def parse_validation_row(row_index: int, row: Dict[str, object]) -> Optional[Dict[str, object]]:
+    row_id = normalize_text(row.get("id"))
+    name = normalize_text(row.get("name"))
+    halal_likelihood = normalize_text(row.get("halal_likelihood"))
+    halal_type = normalize_text(row.get("halal_type"))
+    halal_confidence = parse_int(row.get("halal_confidence"))
+    halal_reasoning_raw = row.get("halal_reasoning")
+    halal_reasoning = "" if halal_reasoning_raw is None else str(halal_reasoning_raw)
+
+    if not (row_id and name and halal_likelihood and halal_type and halal_reasoning):
+        return None
+    if halal_confidence is None:
+        return None
+
+    return {
+        "row_index": row_index,
+        "id": row_id,
+        "name": name,
+        "halal_likelihood": halal_likelihood,
+        "halal_type": halal_type,
+        "halal_confidence": halal_confidence,
+        "halal_reasoning_raw": halal_reasoning,
+    }
+
+
+def classify_row(row: Dict[str, object]) -> Tuple[str, Optional[str], Optional[bool], str]:
+    likelihood_norm = row["halal_likelihood"].strip().upper()
+    type_norm = row["halal_type"].strip().upper()
+    cc_halal_status = map_cc_status(likelihood_norm, type_norm)
+    certifier_org = extract_certifier_org(row["halal_reasoning_raw"])
+    is_zabiha = extract_is_zabiha(row["halal_reasoning_raw"])
+    cc_note = build_cc_note(
+        cc_halal_status,
+        likelihood_norm,
+        row["halal_reasoning_raw"],
+        certifier_org,
+        is_zabiha,
+    )
+    return cc_halal_status, certifier_org, is_zabiha, cc_note
+
+
+def hll_add(registers: bytearray, value: str) -> None:
+    hashed = int.from_bytes(
+        hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big"
+    )
+    index = hashed >> (64 - HLL_PRECISION)
+    remainder = hashed & ((1 << (64 - HLL_PRECISION)) - 1)
+    rank = (64 - HLL_PRECISION) - remainder.bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+
+
+def hll_estimate(registers: bytearray) -> int:
+    size = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / size)
+    estimate = alpha * size * size / sum(2.0 ** -register for register in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * size and zeros:
+        estimate = size * math.log(size / zeros)
+    return int(round(estimate))
+
+
+def counter_quantiles(counts: Counter, quantiles: List[float]) -> Dict[float, int]:
+    total = sum(counts.values())
+    results: Dict[float, int] = {}
+    if not total:
+        return results
+    ordered = sorted(counts.items())
+    for quantile in quantiles:
+        target = max(1, math.ceil(quantile * total))
+        seen = 0
+        for value, count in ordered:
+            seen += count
+            if seen >= target:
+                results[quantile] = value
+                break
+    return results
+
+
 def dedupe_rows(
     rows: List[Dict[str, object]]
 ) -> Tuple[List[Dict[str, object]], Dict[str, List[Dict[str, object]]]]:
@@ -472,10 +937,300 @@ def write_duplicates_report(
             writer.writerow([row.get(col, "") for col in headers])
 
 
+def revert_run(args: argparse.Namespace) -> int:
+    snapshot_path = resolve_snapshot_path(args.revert)
+    if not snapshot_path.exists():
+        print(f"Snapshot not found: {snapshot_path}")
+        return 1
+
+    snapshot_rows = read_snapshot(snapshot_path)
+    if not snapshot_rows:
+        print("Snapshot is empty; nothing to revert.")
+        return 1
+
+    restored_count = 0
+    missing_ids = []
+    if args.use_rest:
+        # PostgREST has no set-based update with per-row values, so REST reverts
+        # patch one row at a time (update-only, not transactional).
+        base_url, api_key = get_supabase_credentials(args)
+        rest_headers = build_rest_headers(api_key)
+        table_name = detect_table_name_rest(base_url, rest_headers)
+        for row in snapshot_rows:
+            if rest_restore_row(base_url, rest_headers, table_name, row):
+                restored_count += 1
+            else:
+                missing_ids.append(row["id"])
+    else:
+        db_url = get_db_url(args.db_url)
+        _, db_module = get_db_module()
+        connection = db_module.connect(db_url)
+        connection.autocommit = False
+        cursor = connection.cursor()
+
+        try:
+            table_name = detect_table_name(cursor)
+            for chunk in chunked(snapshot_rows, SNAPSHOT_CHUNK_SIZE):
+                chunk_missing = restore_snapshot_chunk(cursor, table_name, chunk)
+                restored_count += len(chunk) - len(chunk_missing)
+                missing_ids.extend(chunk_missing)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+    print("Snapshot:", snapshot_path)
+    print("Snapshot rows:", len(snapshot_rows))
+    print("Restored rows count:", restored_count)
+    print("Missing ids count:", len(snapshot_rows) - restored_count)
+    if missing_ids:
+        print("Missing ids:")
+        for missing_id in missing_ids:
+            print(f"- {missing_id}")
+    return 0
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def psql_quote(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def build_export_sql(
+    run_id: str, source_name: str, row_count: int, chunk_names: List[str]
+) -> str:
+    base_name = Path(source_name).stem
+    cc_columns = list(CC_COLUMN_TYPES)
+    stage_definitions = ",\n".join(
+        ["    seq int not null", "    id uuid primary key", "    name_file text"]
+        + [f"    {col} {col_type}" for col, col_type in CC_COLUMN_TYPES.items()]
+    )
+    copy_lines = "\n".join(
+        f"\\copy {EXPORT_STAGE_TABLE} ({', '.join(EXPORT_STAGE_COLUMNS)}) from {psql_quote(name)}"
+        for name in chunk_names
+    )
+    assignments = ",\n".join(f"    {col} = s.{col}" for col in cc_columns)
+    snapshot_query = (
+        f"select {', '.join(f't.{col}' for col in SNAPSHOT_COLUMNS)} "
+        f"from {EXPORT_TARGET_VIEW} t join {EXPORT_STAGE_TABLE} s on s.id = t.id order by s.seq"
+    )
+    applied_query = (
+        "select s.id, s.name_file, t.name as name_db, t.halal_status as existing_halal_status, "
+        "s.cc_halal_status as new_cc_halal_status, "
+        "case when t.halal_status::text is distinct from s.cc_halal_status "
+        "then 'true' else 'false' end as differs_from_existing, "
+        "s.cc_halal_likelihood, s.cc_halal_type, s.cc_halal_confidence, "
+        "case when s.cc_is_zabiha is null then '' when s.cc_is_zabiha then 'true' "
+        "else 'false' end as cc_is_zabiha, "
+        "coalesce(s.cc_certifier_org, '') as cc_certifier_org, s.cc_note "
+        f"from {EXPORT_STAGE_TABLE} s join {EXPORT_TARGET_VIEW} t on t.id = s.id order by s.seq"
+    )
+    missing_query = (
+        f"select s.id, s.name_file from {EXPORT_STAGE_TABLE} s "
+        f"where not exists (select 1 from {EXPORT_TARGET_VIEW} t where t.id = s.id) "
+        "order by s.seq"
+    )
+    return f"""-- Halal validation load artifact generated by ingest_halal_validation.py --export
+-- Run id: {run_id}
+-- Source: {source_name} ({row_count} rows after dedupe, {len(chunk_names)} chunk(s))
+--
+-- From this directory:
+--   sha256sum -c SHA256SUMS
+--   psql "$DATABASE_URL" -f load.sql
+--
+-- Writes {run_id}.tsv (cc_* pre-image, usable with --revert),
+-- {base_name}__applied.csv and {base_name}__missing.csv next to this file.
+
+\\set ON_ERROR_STOP on
+set client_encoding = 'UTF8';
+
+select coalesce(to_regclass('public.place'), to_regclass('public.places'))::text as target_table \\gset
+\\if :{{?target_table}}
+\\else
+do $$ begin raise exception 'Neither public.place nor public.places exists in the database.'; end $$;
+\\endif
+
+begin;
+
+create temp table {EXPORT_STAGE_TABLE} (
+{stage_definitions}
+) on commit drop;
+
+{copy_lines}
+
+analyze {EXPORT_STAGE_TABLE};
+
+create temp view {EXPORT_TARGET_VIEW} as select * from :target_table;
+
+\\copy ({snapshot_query}) to {psql_quote(run_id + '.tsv')}
+
+update :target_table as t
+set
+{assignments}
+from {EXPORT_STAGE_TABLE} s
+where t.id = s.id;
+
+\\copy ({applied_query}) to {psql_quote(base_name + '__applied.csv')} with (format csv, header)
+\\copy ({missing_query}) to {psql_quote(base_name + '__missing.csv')} with (format csv, header)
+
+commit;
+"""
+
+
+def write_export_artifact(
+    export_dir: Path, run_id: str, file_path: Path, rows: List[Dict[str, object]]
+) -> List[Path]:
+    export_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    chunk_names = []
+    for chunk_number, chunk in enumerate(chunked(rows, EXPORT_CHUNK_SIZE), start=1):
+        chunk_name = f"chunk_{chunk_number:04d}.copy"
+        chunk_path = export_dir / chunk_name
+        with chunk_path.open("w", encoding="utf-8", newline="") as handle:
+            for row in chunk:
+                cc_halal_status, certifier_org, is_zabiha, cc_note = classify_row(row)
+                values = [
+                    row["seq"],
+                    row["id"],
+                    row["name"],
+                    cc_halal_status,
+                    row["halal_likelihood"],
+                    row["halal_type"],
+                    row["halal_confidence"],
+                    cc_note,
+                    row["halal_reasoning_raw"],
+                    is_zabiha,
+                    certifier_org,
+                ]
+                handle.write("\t".join(encode_copy_value(value) for value in values) + "\n")
+        chunk_names.append(chunk_name)
+        written.append(chunk_path)
+
+    sql_path = export_dir / "load.sql"
+    sql_path.write_text(
+        build_export_sql(run_id, file_path.name, len(rows), chunk_names), encoding="utf-8"
+    )
+    written.append(sql_path)
+
+    checksum_path = export_dir / "SHA256SUMS"
+    with checksum_path.open("w", encoding="utf-8", newline="") as handle:
+        for path in written:
+            handle.write(f"{sha256_file(path)}  {path.name}\n")
+    written.append(checksum_path)
+    return written
+
+
+def print_histogram(title: str, counts: Counter, total: int) -> None:
+    print(f"{title}:")
+    for value, count in counts.most_common():
+        share = count / total if total else 0.0
+        print(f"- {value or '(empty)'}: {count} ({share:.1%})")
+
+
+def inspect_file(file_path: Path) -> int:
+    registers = bytearray(1 << HLL_PRECISION)
+    likelihood_counts: Counter = Counter()
+    type_counts: Counter = Counter()
+    status_counts: Counter = Counter()
+    confidence_counts: Counter = Counter()
+    certifier_counts: Counter = Counter()
+    zabiha_counts: Counter = Counter()
+    invalid_sample = []
+    total_rows = 0
+    invalid_count = 0
+
+    for idx, row in iter_rows(file_path):
+        if total_rows == 0:
+            missing_columns = REQUIRED_COLUMNS - set(row.keys())
+            if missing_columns:
+                print(f"Missing required columns: {', '.join(sorted(missing_columns))}")
+                return 1
+        total_rows += 1
+
+        parsed = parse_validation_row(idx, row)
+        if parsed is None:
+            invalid_count += 1
+            if len(invalid_sample) < INSPECT_INVALID_SAMPLE:
+                invalid_sample.append(
+                    {
+                        "row_index": idx,
+                        "id": normalize_text(row.get("id")),
+                        "name": normalize_text(row.get("name")),
+                    }
+                )
+            continue
+
+        likelihood_norm = parsed["halal_likelihood"].strip().upper()
+        type_norm = parsed["halal_type"].strip().upper()
+        hll_add(registers, parsed["id"])
+        likelihood_counts[likelihood_norm] += 1
+        type_counts[type_norm] += 1
+        status_counts[map_cc_status(likelihood_norm, type_norm)] += 1
+        # Confidence is a small integer scale, so exact counts stay bounded.
+        confidence_counts[parsed["halal_confidence"]] += 1
+        certifier_counts[extract_certifier_org(parsed["halal_reasoning_raw"]) or ""] += 1
+        zabiha_counts[extract_is_zabiha(parsed["halal_reasoning_raw"])] += 1
+
+    if not total_rows:
+        print("No rows found in file.")
+        return 1
+
+    valid_count = total_rows - invalid_count
+    distinct_ids = min(hll_estimate(registers), valid_count) if valid_count else 0
+    duplicate_rate = 1 - distinct_ids / valid_count if valid_count else 0.0
+    certified_count = valid_count - certifier_counts.pop("", 0)
+
+    print("Inspect report:", file_path)
+    print("File rows total:", total_rows)
+    print("Invalid rows count:", invalid_count)
+    print("Rows after validation:", valid_count)
+    print("Approx distinct ids:", distinct_ids)
+    print(f"Approx duplicate rate: {duplicate_rate:.2%}")
+    print_histogram("halal_likelihood", likelihood_counts, valid_count)
+    print_histogram("halal_type", type_counts, valid_count)
+    print_histogram("cc_halal_status", status_counts, valid_count)
+    quantiles = counter_quantiles(confidence_counts, CONFIDENCE_QUANTILES)
+    print(
+        "halal_confidence quantiles:",
+        ", ".join(f"p{int(q * 100)}={value}" for q, value in quantiles.items()),
+    )
+    certified_share = certified_count / valid_count if valid_count else 0.0
+    print(f"Certifier hit rate: {certified_count} ({certified_share:.1%})")
+    for org, count in certifier_counts.most_common():
+        print(f"- {org}: {count}")
+    zabiha_share = zabiha_counts[True] / valid_count if valid_count else 0.0
+    print(f"Zabiha hit rate: {zabiha_counts[True]} ({zabiha_share:.1%})")
+    print("Zabiha negative mentions:", zabiha_counts[False])
+
+    if invalid_sample:
+        print(f"Invalid rows (first {len(invalid_sample)}):")
+        for row in invalid_sample:
+            print(f"- row {row['row_index']}: id={row['id']} name={row['name']}")
+
+    return 0
+
+
 def main() -> int:
     args = parse_args()
-    if not args.apply:
-        print("This script only runs with --apply.")
+    if args.revert:
+        return revert_run(args)
+    if args.inspect:
+        file_path = resolve_file_path(args.file)
+        if not file_path.exists():
+            print(f"File not found: {file_path}")
+            return 1
+        return inspect_file(file_path)
+    if not args.apply and args.export is None:
+        print("This script only runs with --apply or --export.")
         return 2
 
     file_path = resolve_file_path(args.file)
@@ -483,52 +1238,64 @@ def main() -> int:
         print(f"File not found: {file_path}")
         return 1
 
-    raw_rows = load_rows(file_path)
-    if not raw_rows:
-        print("No rows found in file.")
-        return 1
-
-    header_set = set(raw_rows[0].keys())
-    missing_columns = REQUIRED_COLUMNS - header_set
-    if missing_columns:
-        print(f"Missing required columns: {', '.join(sorted(missing_columns))}")
-        return 1
-
+    # Stream the file and keep only the validated fields, so large inputs are
+    # never held in memory as full source records.
+    total_rows = 0
     parsed_rows = []
     invalid_rows = []
-    for idx, row in enumerate(raw_rows, start=2):
-        row_id = normalize_text(row.get("id"))
-        name = normalize_text(row.get("name"))
-        halal_likelihood = normalize_text(row.get("halal_likelihood"))
-        halal_type = normalize_text(row.get("halal_type"))
-        halal_confidence = parse_int(row.get("halal_confidence"))
-        halal_reasoning_raw = row.get("halal_reasoning")
-        halal_reasoning = "" if halal_reasoning_raw is None else str(halal_reasoning_raw)
-
-        if not (row_id and name and halal_likelihood and halal_type and halal_reasoning):
-            invalid_rows.append({"row_index": idx, "id": row_id, "name": name})
-            continue
-        if halal_confidence is None:
-            invalid_rows.append({"row_index": idx, "id": row_id, "name": name})
+    for idx, row in iter_rows(file_path):
+        if total_rows == 0:
+            missing_columns = REQUIRED_COLUMNS - set(row.keys())
+            if missing_columns:
+                print(f"Missing required columns: {', '.join(sorted(missing_columns))}")
+                return 1
+        total_rows += 1
+
+        parsed = parse_validation_row(idx, row)
+        if parsed is None:
+            invalid_rows.append(
+                {
+                    "row_index": idx,
+                    "id": normalize_text(row.get("id")),
+                    "name": normalize_text(row.get("name")),
+                }
+            )
             continue
+        parsed_rows.append(parsed)
 
-        parsed_rows.append(
-            {
-                "row_index": idx,
-                "id": row_id,
-                "name": name,
-                "halal_likelihood": halal_likelihood,
-                "halal_type": halal_type,
-                "halal_confidence": halal_confidence,
-                "halal_reasoning_raw": halal_reasoning,
-            }
-        )
+    if not total_rows:
+        print("No rows found in file.")
+        return 1
 
     if not parsed_rows:
         print("No valid rows to process after validation.")
         return 1
 
     deduped_rows, duplicates = dedupe_rows(parsed_rows)
+    run_id = make_run_id(file_path)
+    snapshot_path = SNAPSHOTS_DIR / f"{run_id}.tsv.gz"
+    pending_snapshot_path = snapshot_path.with_name(f"{snapshot_path.name}.pending")
+
+    if args.export is not None:
+        export_dir = Path(args.export) if args.export else EXPORTS_DIR / run_id
+        for seq, row in enumerate(deduped_rows, start=1):
+            row["seq"] = seq
+        written = write_export_artifact(export_dir, run_id, file_path, deduped_rows)
+        if duplicates:
+            write_duplicates_report(export_dir / f"{file_path.stem}__duplicates.csv", duplicates)
+
+        print("Run id:", run_id)
+        print("Export artifact:", export_dir)
+        print("Files written:", ", ".join(path.name for path in written))
+        print("File rows total:", total_rows)
+        print("Rows after validation:", len(parsed_rows))
+        print("Rows after dedupe:", len(deduped_rows))
+        print("Duplicates count:", sum(len(items) - 1 for items in duplicates.values()))
+        if invalid_rows:
+            print("Invalid rows skipped:")
+            for row in invalid_rows:
+                print(f"- row {row['row_index']}: id={row['id']} name={row['name']}")
+        return 0
 
     applied_rows = []
     missing_ids = []
@@ -536,27 +1303,15 @@ def main() -> int:
 
     if args.use_rest:
         base_url, api_key = get_supabase_credentials(args)
-        rest_headers = {
-            "apikey": api_key,
-            "Authorization": f"Bearer {api_key}",
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-        }
+        rest_headers = build_rest_headers(api_key)
         table_name = detect_table_name_rest(base_url, rest_headers)
+        preimage_rows = rest_fetch_preimage(
+            base_url, rest_headers, table_name, [row["id"] for row in deduped_rows]
+        )
+        write_snapshot(snapshot_path, preimage_rows)
 
         for row in deduped_rows:
-            likelihood_norm = row["halal_likelihood"].strip().upper()
-            type_norm = row["halal_type"].strip().upper()
-            cc_halal_status = map_cc_status(likelihood_norm, type_norm)
-            certifier_org = extract_certifier_org(row["halal_reasoning_raw"])
-            is_zabiha = extract_is_zabiha(row["halal_reasoning_raw"])
-            cc_note = build_cc_note(
-                cc_halal_status,
-                likelihood_norm,
-                row["halal_reasoning_raw"],
-                certifier_org,
-                is_zabiha,
-            )
+            cc_halal_status, certifier_org, is_zabiha, cc_note = classify_row(row)
 
             payload = {
                 "cc_halal_status": cc_halal_status,
@@ -606,6 +1361,12 @@ def main() -> int:
 
         try:
             table_name = detect_table_name(cursor)
+            preimage_rows = fetch_preimage(
+                cursor, table_name, [row["id"] for row in deduped_rows]
+            )
+            # Keep the snapshot under a pending name until the transaction commits,
+            # so a rolled-back run leaves nothing behind.
+            write_snapshot(pending_snapshot_path, preimage_rows)
             update_sql = f"""
                 update public.{table_name}
                 set
@@ -622,18 +1383,7 @@ def main() -> int:
             """
 
             for row in deduped_rows:
-                likelihood_norm = row["halal_likelihood"].strip().upper()
-                type_norm = row["halal_type"].strip().upper()
-                cc_halal_status = map_cc_status(likelihood_norm, type_norm)
-                certifier_org = extract_certifier_org(row["halal_reasoning_raw"])
-                is_zabiha = extract_is_zabiha(row["halal_reasoning_raw"])
-                cc_note = build_cc_note(
-                    cc_halal_status,
-                    likelihood_norm,
-                    row["halal_reasoning_raw"],
-                    certifier_org,
-                    is_zabiha,
-                )
+                cc_halal_status, certifier_org, is_zabiha, cc_note = classify_row(row)
 
                 cursor.execute(
                     update_sql,
@@ -677,6 +1427,7 @@ def main() -> int:
             expected_found = len(deduped_rows) - len(missing_ids)
             if len(updated_ids) != expected_found:
                 connection.rollback()
+                pending_snapshot_path.unlink(missing_ok=True)
                 missing_update_ids = [
                     row["id"] for row in deduped_rows if row["id"] not in updated_ids
                 ]
@@ -689,10 +1440,12 @@ def main() -> int:
             connection.commit()
         except Exception:
             connection.rollback()
+            pending_snapshot_path.unlink(missing_ok=True)
             raise
         finally:
             cursor.close()
             connection.close()
+        pending_snapshot_path.replace(snapshot_path)
 
     expected_found = len(deduped_rows) - len(missing_ids)
     if len(updated_ids) != expected_found:
@@ -716,8 +1469,10 @@ def main() -> int:
     differs_count = sum(1 for row in applied_rows if row["differs_from_existing"] == "true")
     duplicate_count = sum(len(items) - 1 for items in duplicates.values())
 
+    print("Run id:", run_id)
+    print("Snapshot:", snapshot_path)
     print("Applied report:", applied_report_path)
-    print("File rows total:", len(raw_rows))
+    print("File rows total:", total_rows)
     print("Rows after validation:", len(parsed_rows))
     print("Rows after dedupe:", len(deduped_rows))
     print("Updated rows count:", len(applied_rows))